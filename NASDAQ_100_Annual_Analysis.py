@@ -1,210 +1,214 @@
+import duckdb
+import math
+import os
 import pandas as pd
-import requests
-import yfinance as yf
 import numpy as np
-from datetime import datetime
+import xlsxwriter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 
-
-# NASDAQ 100 symbols
-
-url = "https://www.slickcharts.com/nasdaq100"
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                  "(KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-}
-
-response = requests.get(url, headers=headers)
-response.raise_for_status()
-tables = pd.read_html(response.text)
-nasdaq100_table = tables[0]
-symbols = nasdaq100_table['Symbol'].tolist()  
+from nasdaq_common import (MAX_WORKERS, column_array, fetch_gate, get_institutional_data,
+                           get_symbols, get_tickers, memory, trend_scores)
 
 
 # Financials (Gross Profit, Liabilities, EPS)
 
 current_year = datetime.now().year - 1
 start_year = current_year - 3  # last 4 years
-results = []
 
-for symbol in symbols:
-    ticker = yf.Ticker(symbol)
+RESULT_COLUMNS = ('Symbol', 'Year', 'Gross_Profit', 'EPS',
+                  'Current_Liabilities', 'Other_Current_Liabilities', 'Total_Assets')
+
+
+@memory.cache
+def fetch_symbol(symbol, fetch_date):
+    ticker = get_tickers()[symbol]
+    # Column-layout (SoA) staging: one typed list per output column
+    # instead of a dict allocation and per-key unboxing for every row
+    cols = {name: [] for name in RESULT_COLUMNS}
+    by_year = {}  # year -> row position, so balance rows find their match in O(1)
     try:
-        income = ticker.financials.T
-        balance = ticker.balance_sheet.T
+        with fetch_gate:
+            income = ticker.financials.T
+            balance = ticker.balance_sheet.T
 
         # Ensure numeric
         income = income.apply(pd.to_numeric, errors='coerce')
         balance = balance.apply(pd.to_numeric, errors='coerce')
 
+        # Keep only the wanted reporting years before extracting anything:
+        # Yahoo often returns more history than the 4 years we score
+        income_years = np.asarray(income.index.year)
+        income_mask = (income_years >= start_year) & (income_years <= current_year)
+        income = income.loc[income_mask]
+        income_years = income_years[income_mask]
+
+        balance_years = np.asarray(balance.index.year)
+        balance_mask = (balance_years >= start_year) & (balance_years <= current_year)
+        balance = balance.loc[balance_mask]
+        balance_years = balance_years[balance_mask]
+
         # Collect Gross Profit & EPS
-        for year in income.index:
-            year_int = year.year
-            if start_year <= year_int <= current_year:
-                gp = income.get('Gross Profit', pd.Series()).get(year, np.nan)
-
-                # EPS (Basic EPS or Diluted EPS)
-                if 'Basic EPS' in income.columns:
-                    eps = income['Basic EPS'].get(year, np.nan)
-                elif 'Diluted EPS' in income.columns:
-                    eps = income['Diluted EPS'].get(year, np.nan)
-                else:
-                    eps = np.nan
-
-                results.append({
-                    'Symbol': symbol,
-                    'Year': year_int,
-                    'Gross_Profit': gp,
-                    'EPS': eps
-                })
+        gp_arr = column_array(income, 'Gross Profit')
+
+        # EPS (Basic EPS or Diluted EPS)
+        if 'Basic EPS' in income.columns:
+            eps_arr = income['Basic EPS'].to_numpy(dtype=np.float64)
+        elif 'Diluted EPS' in income.columns:
+            eps_arr = income['Diluted EPS'].to_numpy(dtype=np.float64)
+        else:
+            eps_arr = np.full(len(income), np.nan)
+
+        for i in range(len(income_years)):
+            year_int = int(income_years[i])
+            by_year[year_int] = len(cols['Year'])
+            cols['Symbol'].append(symbol)
+            cols['Year'].append(year_int)
+            cols['Gross_Profit'].append(gp_arr[i])
+            cols['EPS'].append(eps_arr[i])
+            cols['Current_Liabilities'].append(np.nan)
+            cols['Other_Current_Liabilities'].append(np.nan)
+            cols['Total_Assets'].append(np.nan)
 
         # Collect Balance Sheet items
-        for year in balance.index:
-            year_int = year.year
-            if start_year <= year_int <= current_year:
-                cl = balance.get('Current Liabilities', pd.Series()).get(year, np.nan)
-                ocl = balance.get('Other Current Liabilities', pd.Series()).get(year, 0)
-                ta = balance.get('Total Assets', pd.Series()).get(year, np.nan)
-
-                # Update existing record
-                match = next((r for r in results if r['Symbol']==symbol and r['Year']==year_int), None)
-                if match:
-                    match['Current_Liabilities'] = cl
-                    match['Other_Current_Liabilities'] = ocl
-                    match['Total_Assets'] = ta
-                else:
-                    results.append({
-                        'Symbol': symbol,
-                        'Year': year_int,
-                        'Gross_Profit': np.nan,
-                        'EPS': np.nan,
-                        'Current_Liabilities': cl,
-                        'Other_Current_Liabilities': ocl,
-                        'Total_Assets': ta
-                    })
+        cl_arr = column_array(balance, 'Current Liabilities')
+        ocl_arr = column_array(balance, 'Other Current Liabilities', default=0)
+        ta_arr = column_array(balance, 'Total Assets')
+
+        for i in range(len(balance_years)):
+            year_int = int(balance_years[i])
+
+            # Update existing row
+            pos = by_year.get(year_int)
+            if pos is not None:
+                cols['Current_Liabilities'][pos] = cl_arr[i]
+                cols['Other_Current_Liabilities'][pos] = ocl_arr[i]
+                cols['Total_Assets'][pos] = ta_arr[i]
+            else:
+                by_year[year_int] = len(cols['Year'])
+                cols['Symbol'].append(symbol)
+                cols['Year'].append(year_int)
+                cols['Gross_Profit'].append(np.nan)
+                cols['EPS'].append(np.nan)
+                cols['Current_Liabilities'].append(cl_arr[i])
+                cols['Other_Current_Liabilities'].append(ocl_arr[i])
+                cols['Total_Assets'].append(ta_arr[i])
     except Exception as e:
         print(f"Could not fetch financials for {symbol}: {e}")
+    return cols
 
-df = pd.DataFrame(results)
-
-if not df.empty:
-    df = df.sort_values(['Symbol','Year'])
-
-    # Convert all numeric columns
-    num_cols = ['Gross_Profit','EPS','Current_Liabilities','Other_Current_Liabilities','Total_Assets']
-    for col in num_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    # Gross Profit YOY %
-    df['Gross_Profit_YOY_%'] = df.groupby('Symbol')['Gross_Profit'].transform(lambda x: ((x - x.shift(1))/x.shift(1))*100)
 
-    # Current Liabilities YOY %
-    df['Liability_YOY_%'] = df.groupby('Symbol')['Current_Liabilities'].transform(lambda x: ((x - x.shift(1))/x.shift(1))*100)
+def main():
+    symbols = get_symbols()
 
-    # EPS YOY %
-    df['EPS_YOY_%'] = df.groupby('Symbol')['EPS'].transform(lambda x: ((x - x.shift(1))/x.shift(1))*100)
+    # The raw long-format frame is persisted as Parquet so re-analysis runs
+    # can skip Yahoo entirely; delete the file to force a fresh fetch.
+    raw_parquet = "Nasdaq100_Annual_raw_financials.parquet"
 
-    # Liability-to-Asset Ratio
-    df['Liability_to_Asset_Ratio'] = ((df['Current_Liabilities'].fillna(0) + df['Other_Current_Liabilities'].fillna(0)) / df['Total_Assets'] * 100)
+    if os.path.exists(raw_parquet):
+        df = pd.read_parquet(raw_parquet)
+        print(f"Loaded raw financials from {raw_parquet}")
+    else:
+        columns = {name: [] for name in RESULT_COLUMNS}
+        fetch_date = str(date.today())
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for cols in executor.map(lambda s: fetch_symbol(s, fetch_date), symbols):
+                for name in RESULT_COLUMNS:
+                    columns[name].extend(cols[name])
 
-    # Pivot tables
-    df_gp = df.pivot(index='Symbol', columns='Year', values='Gross_Profit_YOY_%')
-    df_liab = df.pivot(index='Symbol', columns='Year', values='Liability_YOY_%')
-    df_eps = df.pivot(index='Symbol', columns='Year', values='EPS_YOY_%')
-    df_ratio = df.groupby('Symbol')['Liability_to_Asset_Ratio'].mean().to_frame()
+        df = pd.DataFrame(columns)
+        if not df.empty:
+            df.to_parquet(raw_parquet, compression='zstd')
 
     years_order = [current_year, current_year-1, current_year-2, current_year-3]
-    df_gp = df_gp.reindex(columns=years_order)
-    df_liab = df_liab.reindex(columns=years_order)
-    df_eps = df_eps.reindex(columns=years_order)
 
-    df_gp.columns = [f"{year}(GP%)" for year in df_gp.columns]
-    df_liab.columns = [f"{year}(LiabilityYOY%)" for year in df_liab.columns]
-    df_eps.columns = [f"{year}(EPS%)" for year in df_eps.columns]
+    if not df.empty:
+        # One DuckDB plan computes the YOY window functions, the per-year
+        # pivot, and the ratio aggregation straight off the long frame,
+        # replacing the chain of eagerly materialized pandas steps (sort,
+        # three pct_change passes, unstack, groupby-mean, reassembly).
+        con = duckdb.connect()
+        con.register('raw', df)
+        pivots = [f'avg(CASE WHEN Year = {year} THEN gp_yoy END) AS "{year}(GP%)"' for year in years_order]
+        pivots += [f'avg(CASE WHEN Year = {year} THEN liab_yoy END) AS "{year}(LiabilityYOY%)"' for year in years_order]
+        pivots += [f'avg(CASE WHEN Year = {year} THEN eps_yoy END) AS "{year}(EPS%)"' for year in years_order]
+        df_final = con.execute(f"""
+            WITH yoy AS (
+                SELECT Symbol, Year,
+                       (Gross_Profit / LAG(Gross_Profit) OVER w - 1) * 100 AS gp_yoy,
+                       (Current_Liabilities / LAG(Current_Liabilities) OVER w - 1) * 100 AS liab_yoy,
+                       (EPS / LAG(EPS) OVER w - 1) * 100 AS eps_yoy,
+                       (COALESCE(Current_Liabilities, 0) + COALESCE(Other_Current_Liabilities, 0))
+                           / Total_Assets * 100 AS ratio
+                FROM raw
+                WINDOW w AS (PARTITION BY Symbol ORDER BY Year)
+            )
+            SELECT Symbol, {', '.join(pivots)},
+                   avg(ratio) AS Liability_to_Asset_Ratio
+            FROM yoy
+            GROUP BY Symbol
+        """).df().set_index('Symbol')
+        con.close()
+    else:
+        df_final = pd.DataFrame(index=symbols)
 
-    df_final = pd.concat([df_gp, df_liab, df_eps, df_ratio], axis=1)
-else:
-    df_final = pd.DataFrame(index=symbols)
 
+    # Institutional Holdings
 
-# Institutional Holdings
-
-def get_filtered_institutional_data_df(ticker_symbol, organizations):
-    try:
-        stock = yf.Ticker(ticker_symbol)
-        institutional_holders = stock.institutional_holders
-
-        if institutional_holders is not None and not institutional_holders.empty:
-            results = []
-            for org in organizations:
-                org_row = institutional_holders[
-                    institutional_holders['Holder'].str.contains(org, case=False, na=False)
-                ]
-                if not org_row.empty:
-                    holder_name = org_row['Holder'].iloc[0]
-                    pct_held = org_row['pctHeld'].iloc[0] * 100
-                    pct_change = org_row['pctChange'].iloc[0] * 100
-                    results.append(f"{holder_name}: Held {pct_held:.2f}% | Change {pct_change:.2f}%   ")
-            return "; ".join(results) if results else "No match"
-        else:
-            return "No institutional holders data"
-    except Exception as e:
-        return f"Error: {e}"
+    inst_data = get_institutional_data()
 
-organizations_list = [
-    "Vanguard", "Charles Schwab", "BlackRock", "Morgan Stanley",
-    "BNY Mellon", "Fidelity", "Goldman Sachs", "Standard Chartered",
-    "UBS Group", "Wells Fargo","Berkshire Hathaway","JPMorgan Chase & Co"
-]
+    df_institutional = pd.DataFrame.from_dict(inst_data, orient='index', columns=['Institutional_Holdings'])
 
-inst_data = {}
-for ticker in symbols:
-    inst_data[ticker] = get_filtered_institutional_data_df(ticker, organizations_list)
 
-df_institutional = pd.DataFrame.from_dict(inst_data, orient='index', columns=['Institutional_Holdings'])
+    # Merge financial + institutional data
 
+    df_combined = df_final.merge(df_institutional, left_index=True, right_index=True).reset_index()
+    df_combined.rename(columns={"index": "Symbol"}, inplace=True)
 
-# Merge financial + institutional data
 
-df_combined = df_final.merge(df_institutional, left_index=True, right_index=True).reset_index()
-df_combined.rename(columns={"index": "Symbol"}, inplace=True)
+    # Continuous Trend Scoring (-1 to 1)
 
+    gp_scores = trend_scores(df_combined, [f"{y}(GP%)" for y in years_order[::-1]])
+    liab_scores = -trend_scores(df_combined, [f"{y}(LiabilityYOY%)" for y in years_order[::-1]])  # negative slope good
+    eps_scores = trend_scores(df_combined, [f"{y}(EPS%)" for y in years_order[::-1]])
 
-# Continuous Trend Scoring (-1 to 1)
+    # Normalize Liability-to-Asset Ratio
+    ratio = df_combined["Liability_to_Asset_Ratio"].to_numpy(dtype=np.float64)
+    min_val = np.nanmin(ratio)
+    max_val = np.nanmax(ratio)
+    ratio_scores = (ratio - min_val) / (max_val - min_val)
 
-def trend_score(values):
-    values = [v for v in values if pd.notna(v)]
-    if len(values) < 2:
-        return 0
-    x = np.arange(len(values))
-    y = np.array(values)
-    slope = np.polyfit(x, y, 1)[0]
-    return np.tanh(slope / 50)  
+    # Stage the four score columns column-major (F order) so the per-column
+    # writes and reductions below walk contiguous memory
+    scores = np.asfortranarray(np.column_stack([gp_scores, liab_scores, eps_scores, ratio_scores]))
+    score_cols = ["GP_Trend_Score", "Liability_Trend_Score", "EPS_Trend_Score", "Liability_to_Asset_Score"]
+    df_combined[score_cols] = scores
 
-df_combined["GP_Trend_Score"] = df_combined.apply(lambda row: trend_score([row.get(f"{y}(GP%)") for y in years_order[::-1]]), axis=1)
-df_combined["Liability_Trend_Score"] = df_combined.apply(lambda row: -trend_score([row.get(f"{y}(LiabilityYOY%)") for y in years_order[::-1]]), axis=1)  # negative slope good
-df_combined["EPS_Trend_Score"] = df_combined.apply(lambda row: trend_score([row.get(f"{y}(EPS%)") for y in years_order[::-1]]), axis=1)
+    # Final Score
+    df_combined["Final_Score"] = scores.sum(axis=1)
 
-# Normalize Liability-to-Asset Ratio
-min_val = df_combined["Liability_to_Asset_Ratio"].min()
-max_val = df_combined["Liability_to_Asset_Ratio"].max()
-df_combined["Liability_to_Asset_Score"] = (df_combined["Liability_to_Asset_Ratio"] - min_val) / (max_val - min_val)
+    df_combined = df_combined.sort_values("Final_Score", ascending=False).reset_index(drop=True)
 
-# Final Score
-df_combined["Final_Score"] = (
-    df_combined["GP_Trend_Score"] +
-    df_combined["Liability_Trend_Score"] +
-    df_combined["EPS_Trend_Score"] +
-    df_combined["Liability_to_Asset_Score"]
-)
 
-df_combined = df_combined.sort_values("Final_Score", ascending=False).reset_index(drop=True)
+    # Export to Excel
 
+    output_file = "Nasdaq100_Annually_Data_Analysis.xlsx"
+    # xlsxwriter in constant-memory mode streams rows to disk instead of
+    # holding the whole workbook as an XML tree the way openpyxl does.
+    # Rows must be written in order (to_excel writes column-by-column, which
+    # constant_memory would silently drop), so stream them ourselves.
+    with xlsxwriter.Workbook(output_file, {'constant_memory': True}) as workbook:
+        sheet = workbook.add_worksheet("All_Data")
+        sheet.write_row(0, 0, df_combined.columns)
+        for r, row in enumerate(df_combined.itertuples(index=False), start=1):
+            sheet.write_row(r, 0, [None if isinstance(v, float) and math.isnan(v) else v for v in row])
 
-# Export to Excel
+    # Columnar copy for downstream tools: much faster to (re)read than Excel
+    df_combined.to_parquet("Nasdaq100_Annual.parquet", compression='zstd')
 
-output_file = "Nasdaq100_Annually_Data_Analysis.xlsx"
-df_combined.to_excel(output_file, sheet_name="All_Data", index=False)
+    print(f"\nAnually data exported: {output_file}")
+    print(df_combined[["Symbol","Final_Score"]])
 
-print(f"\nAnually data exported: {output_file}")
-print(df_combined[["Symbol","Final_Score"]])
 
+if __name__ == "__main__":
+    main()
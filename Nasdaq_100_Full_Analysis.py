@@ -0,0 +1,13 @@
+"""Run the annual and quarterly NASDAQ 100 analyses in one process.
+
+The shared module caches the slickcharts symbol list, HTTP session,
+Ticker objects, and institutional-holder data, so running both pipelines
+from here hits Yahoo half as often as running the scripts separately.
+"""
+
+import NASDAQ_100_Annual_Analysis as annual
+import Nasdaq_100_Quartely_Analysis as quarterly
+
+if __name__ == "__main__":
+    annual.main()
+    quarterly.main()
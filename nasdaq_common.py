@@ -0,0 +1,186 @@
+"""Shared plumbing for the NASDAQ 100 annual and quarterly analyses.
+
+Both pipelines need the same slickcharts symbol list, HTTP session,
+Ticker cache, institutional-holder data, and trend scoring. Keeping them
+here means running annual and quarterly in one process fetches each of
+those exactly once.
+"""
+
+import aiohttp
+import asyncio
+import functools
+import pandas as pd
+import re
+import requests_cache
+import yfinance as yf
+import numpy as np
+import threading
+from io import StringIO
+from joblib import Memory
+from numba import njit, prange
+
+
+# NASDAQ 100 symbols
+
+url = "https://www.slickcharts.com/nasdaq100"
+headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
+}
+
+async def fetch_slickcharts():
+    async with aiohttp.ClientSession(headers=headers) as http:
+        async with http.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.text()
+
+@functools.lru_cache(maxsize=None)
+def get_symbols():
+    tables = pd.read_html(StringIO(asyncio.run(fetch_slickcharts())))
+    return tables[0]['Symbol'].tolist()
+
+
+# One shared session keeps TCP connections and Yahoo's cookie/crumb alive
+# across the thread pool; one Ticker per symbol is reused for every endpoint.
+# Tickers are built in batches of 20 (Yahoo's multi-symbol limit) so the
+# whole batch shares a single session/crumb handshake. Responses are
+# cached to sqlite for a day so re-runs don't hammer Yahoo's rate limit.
+session = requests_cache.CachedSession('yfinance_cache', backend='sqlite', expire_after=86400)
+session.headers.update(headers)
+
+# Fetched statements are also memoized on disk, keyed by symbol and day,
+# so repeated runs during development skip the network entirely.
+memory = Memory('./.cache', verbose=0)
+
+BATCH_SIZE = 20
+MAX_WORKERS = 16  # fetches are network-bound, so threads give near-linear speedup
+
+# Financial statements have no batch endpoint, so cap in-flight requests
+# below the worker count to stay clear of Yahoo's 429 rate limit.
+fetch_gate = threading.Semaphore(8)
+
+_tickers = {}
+
+def get_tickers():
+    # Built once per process; both pipelines share the same Ticker objects.
+    if not _tickers:
+        symbols = get_symbols()
+        for i in range(0, len(symbols), BATCH_SIZE):
+            batch = yf.Tickers(" ".join(symbols[i:i + BATCH_SIZE]), session=session)
+            _tickers.update(batch.tickers)
+    return _tickers
+
+
+def column_array(frame, name, default=np.nan):
+    # One columnar read instead of a label lookup per cell
+    if name in frame.columns:
+        return frame[name].to_numpy(dtype=np.float64)
+    return np.full(len(frame), default, dtype=np.float64)
+
+
+# Institutional Holdings
+
+organizations_list = [
+    "Vanguard", "Charles Schwab", "BlackRock", "Morgan Stanley",
+    "BNY Mellon", "Fidelity", "Goldman Sachs", "Standard Chartered",
+    "UBS Group", "Wells Fargo","Berkshire Hathaway","JPMorgan Chase & Co"
+]
+
+# One alternation with a capture group per organization; a single regex
+# pass over the Holder column replaces 12 separate str.contains scans.
+org_pattern = re.compile("|".join(f"({re.escape(org)})" for org in organizations_list), re.IGNORECASE)
+
+def get_filtered_institutional_data_df(ticker_symbol, organizations):
+    try:
+        stock = get_tickers()[ticker_symbol]
+        institutional_holders = stock.institutional_holders
+
+        if institutional_holders is not None and not institutional_holders.empty:
+            matches = institutional_holders['Holder'].str.extract(org_pattern)
+            results = []
+            for i, org in enumerate(organizations):
+                hit = matches[i].first_valid_index()
+                if hit is not None:
+                    holder_name = institutional_holders['Holder'].loc[hit]
+                    pct_held = institutional_holders['pctHeld'].loc[hit] * 100
+                    pct_change = institutional_holders['pctChange'].loc[hit] * 100
+                    results.append(f"{holder_name}: Held {pct_held:.2f}% | Change {pct_change:.2f}%")
+            return "; ".join(results) if results else "No match"
+        else:
+            return "No institutional holders data"
+    except Exception as e:
+        return f"Error: {e}"
+
+async def gather_institutional_data(symbols):
+    # yfinance is synchronous, so each holder fetch runs in the default
+    # executor; the semaphore caps in-flight Yahoo requests.
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(20)
+
+    async def fetch_one(symbol):
+        async with limit:
+            return await loop.run_in_executor(
+                None, get_filtered_institutional_data_df, symbol, organizations_list)
+
+    values = await asyncio.gather(*[fetch_one(s) for s in symbols])
+    return dict(zip(symbols, values))
+
+_inst_data = None
+
+def get_institutional_data():
+    # Fetched once per process and shared between the pipelines
+    global _inst_data
+    if _inst_data is None:
+        _inst_data = asyncio.run(gather_institutional_data(get_symbols()))
+    return _inst_data
+
+
+# Continuous Trend Scoring (-1 to 1)
+
+# The score window is always the same 4 periods, so the x-axis statistics
+# are constants: mean of x = 0..3 and its centered sum of squares.
+N_PERIODS = 4
+X_MEAN = (N_PERIODS - 1) / 2.0
+X_DENOM = float(np.sum((np.arange(N_PERIODS) - X_MEAN) ** 2))
+
+
+@njit(parallel=True, cache=True)
+def _trend_score_kernel(Y):
+    # NaN-skipping least-squares slope -> tanh score, one row per thread.
+    # Rows with fewer than 2 non-NaN values score 0, as before.
+    out = np.empty(Y.shape[0])
+    full_width = Y.shape[1] == N_PERIODS
+    for r in prange(Y.shape[0]):
+        n = 0
+        sx = 0.0
+        sy = 0.0
+        for c in range(Y.shape[1]):
+            if not np.isnan(Y[r, c]):
+                n += 1
+                sx += c
+                sy += Y[r, c]
+        if n < 2:
+            out[r] = 0.0
+            continue
+        if full_width and n == N_PERIODS:
+            # Complete row: use the precomputed x stats and skip the
+            # variance accumulation entirely
+            y_mean = sy / N_PERIODS
+            cov = 0.0
+            for c in range(N_PERIODS):
+                cov += (c - X_MEAN) * (Y[r, c] - y_mean)
+            out[r] = np.tanh((cov / X_DENOM) / 50)
+            continue
+        x_mean = sx / n
+        y_mean = sy / n
+        cov = 0.0
+        var = 0.0
+        for c in range(Y.shape[1]):
+            if not np.isnan(Y[r, c]):
+                cov += (c - x_mean) * (Y[r, c] - y_mean)
+                var += (c - x_mean) ** 2
+        out[r] = np.tanh((cov / var) / 50)
+    return out
+
+def trend_scores(frame, cols):
+    return _trend_score_kernel(frame[cols].to_numpy(dtype=np.float64))